@@ -1,29 +1,48 @@
 # streamlit_app.py
 import streamlit as st
-from transformers import pipeline
-import speech_recognition as sr
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, pipeline
+from transformers.pytorch_utils import Conv1D
+from faster_whisper import WhisperModel
 from pydub import AudioSegment
-import os, tempfile, subprocess
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+import os, io, re, asyncio, wave, shutil, functools, queue, threading, time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from collections import OrderedDict, deque
+import httpx
+from bs4 import BeautifulSoup
 from gtts import gTTS
 
+# Piper is optional: local neural TTS, falls back to gTTS when unavailable
+try:
+    from piper.voice import PiperVoice
+except ImportError:
+    PiperVoice = None
+
 # Use deep-translator instead of googletrans (works on Python 3.13+)
 from deep_translator import GoogleTranslator
+from langdetect import DetectorFactory, LangDetectException, detect
+
+DetectorFactory.seed = 0  # deterministic language detection
 
 # -------------------------
 # FFmpeg detection
 # -------------------------
+# probed once per process (functools.cache would be reset by every script rerun)
+@st.cache_resource(show_spinner=False)
 def check_ffmpeg():
-    try:
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return True
-    except FileNotFoundError:
-        return False
+    # a PATH lookup is enough: we only need to know the binary exists
+    return shutil.which("ffmpeg") is not None
 
-ffmpeg_ok = check_ffmpeg()
+if "ffmpeg_ok" not in st.session_state:
+    st.session_state["ffmpeg_ok"] = check_ffmpeg()
+ffmpeg_ok = st.session_state["ffmpeg_ok"]
 if not ffmpeg_ok:
     st.warning(
         "⚠️ FFmpeg not detected! Please install it from https://www.gyan.dev/ffmpeg/builds/ "
-        "and add it to your PATH. Audio conversion (mp3 → wav) may not work without it."
+        "and add it to your PATH. Decoding m4a uploads may not work without it."
     )
 
 # -------------------------
@@ -33,104 +52,413 @@ st.set_page_config(page_title="NLP Chatbot: Parent–Teacher Communication", lay
 st.title("🗣️ NLP Chatbot for Parent–Teacher Communication (Prototype)")
 
 st.sidebar.header("⚙️ Settings")
-interface_lang = st.sidebar.selectbox("Select Language", ["auto", "en", "hi", "bn", "mr", "ta", "te"])
-enable_tts = st.sidebar.checkbox("Enable Text-to-Speech (gTTS)", value=True)
+LANGUAGES = ["auto", "en", "hi", "bn", "mr", "ta", "te"]
+interface_lang = st.sidebar.selectbox("Select Language", LANGUAGES)
+enable_tts = st.sidebar.checkbox("Enable Text-to-Speech", value=True)
+stream_replies = st.sidebar.checkbox(
+    "Stream replies", value=True,
+    help="Show tokens as they are generated. Streamed turns run alone and are never batched with other sessions.",
+)
+max_new_tokens = st.sidebar.slider("Max reply tokens", min_value=16, max_value=256, value=64, step=16)
 model_name = st.sidebar.text_input("Hugging Face Model", value="microsoft/DialoGPT-small")
 
 # -------------------------
-# Model loader (tries conversational -> fallback to text-generation)
-# Returns a dict: {'pipe': pipeline_obj, 'task': 'conversational'|'text-generation'}
+# Model loader (explicit load in reduced precision, wrapped into a text-generation pipeline)
+# Returns a dict: {'pipe': pipeline_obj, 'task': 'text-generation'}
+# Set BACKEND=ort to run an INT8-quantized ONNX Runtime export instead of PyTorch eager.
 # -------------------------
+BACKEND = os.environ.get("BACKEND", "torch").lower()
+ORT_CACHE_DIR = os.path.join("models", "ort")
+
+class ORTGenerator:
+    # exposes .model/.tokenizer like a pipeline, so the warm-up and the batcher
+    # drive both backends the same way
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+def load_ort_model(name):
+    # optional dependency: pip install optimum[onnxruntime]
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    save_dir = os.path.join(ORT_CACHE_DIR, name.replace("/", "__"))
+    if not os.path.exists(os.path.join(save_dir, "model_quantized.onnx")):
+        # one-off export + dynamic INT8 quantization, reused from disk afterwards
+        exported = ORTModelForCausalLM.from_pretrained(name, export=True, provider="CPUExecutionProvider")
+        exported.save_pretrained(save_dir)
+        AutoTokenizer.from_pretrained(name).save_pretrained(save_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        # name the file save_pretrained wrote: older optimum exports several .onnx files
+        # (decoder / with_past / merged) and the quantizer refuses to guess between them
+        quantizer = ORTQuantizer.from_pretrained(save_dir, file_name="model.onnx")
+        quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+    tok = AutoTokenizer.from_pretrained(save_dir)
+    model = ORTModelForCausalLM.from_pretrained(save_dir, file_name="model_quantized.onnx", provider="CPUExecutionProvider")
+    return ORTGenerator(model, tok)
+
+def select_device():
+    # (pipeline device, weight dtype): FP16 for tensor cores on CUDA, FP32 on CPU
+    if torch.cuda.is_available():
+        return 0, torch.float16
+    return -1, torch.float32
+
+def quantize_int8(model):
+    # GPT-2 style models (DialoGPT) implement their projections as Conv1D, which
+    # quantize_dynamic doesn't recognise: swap them for equivalent nn.Linear first
+    for parent in list(model.modules()):
+        for child_name, child in parent.named_children():
+            if isinstance(child, Conv1D):
+                # Conv1D stores its weight as (in_features, out_features); skip_init avoids
+                # allocating and randomly initializing a weight that is overwritten right away
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.utils.skip_init(torch.nn.Linear, in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, child_name, linear)
+    # leave the output projection alone: it is tied to the input embeddings, and
+    # quantizing it would keep a second copy of the vocabulary matrix
+    lm_head = model.get_output_embeddings()
+    targets = {name for name, m in model.named_modules() if isinstance(m, torch.nn.Linear) and m is not lm_head}
+    return torch.ao.quantization.quantize_dynamic(model, targets, dtype=torch.qint8)
+
+WARM_UP_BATCHES = [
+    ["Hello there", "Hi"],                          # left-padded batch of 2
+    ["How are you doing today?", "Good morning"],   # new prompt length: sequence dim goes dynamic
+    ["Hi", "Good morning", "Hello there"],          # new batch size: batch dim goes dynamic
+    ["Hello there, how are you?"],                  # single prompt: size-1 dims are always specialized
+]
+
+def warm_up(p):
+    # tiny generations through the serving path (EOS-terminated prompts, left-padded
+    # batches) so lazy CUDA/cuBLAS init, ORT session setup and graph tracing happen
+    # once inside the cached loader, for the shapes real traffic produces, instead
+    # of on the user's first Send
+    for texts in WARM_UP_BATCHES:
+        prompts = [encode_prompt(p.tokenizer, text) for text in texts]
+        generate_tokens(p.model, p.tokenizer, prompts, max_new_tokens=4)
+
+def compile_model(p):
+    # Inductor-compile the forward pass; the warm-up pays the compilation cost at load
+    # time, and any backend that can't be compiled (e.g. quantized ops) stays eager.
+    # mode="default" rather than "reduce-overhead": generate() grows a dynamic KV cache
+    # every decode step, so CUDA graphs would be re-recorded for each new length.
+    # After the warm-up the model is only driven from the Batcher thread.
+    # Returns True if the model was compiled and warmed up.
+    eager_forward = p.model.forward
+    p.model.forward = torch.compile(eager_forward, mode="default", fullgraph=False)
+    try:
+        warm_up(p)
+        return True
+    except Exception:
+        p.model.forward = eager_forward
+        return False
+
 @st.cache_resource
 def load_model(name):
-    # try conversational first
     try:
-        p = pipeline("conversational", model=name)
-        return {"pipe": p, "task": "conversational"}
+        if BACKEND == "ort":
+            p = load_ort_model(name)
+        else:
+            tok = AutoTokenizer.from_pretrained(name)
+            device, dtype = select_device()
+            model = AutoModelForCausalLM.from_pretrained(name, torch_dtype=dtype, low_cpu_mem_usage=True)
+            if device == -1:
+                # CPU: dynamic INT8 quantization of the Linear layers (VNNI kernels where available)
+                model = quantize_int8(model)
+            model.eval()
+            p = pipeline("text-generation", model=model, tokenizer=tok, device=device)
+        # decoder-only models need left padding (and a pad token) for batched generation
+        p.tokenizer.padding_side = "left"
+        if p.tokenizer.pad_token is None:
+            p.tokenizer.pad_token = p.tokenizer.eos_token
+        if BACKEND == "ort" or not compile_model(p):
+            try:
+                warm_up(p)
+            except Exception:
+                pass
+        return {"pipe": p, "task": "text-generation"}
     except Exception as e:
-        # try text-generation fallback
+        st.error(f"Model load failed for {name}: {e}")
+        return {"pipe": None, "task": None}
+
+# -------------------------
+# Generation on token ids: the prompt is tokenized once per turn and the same ids
+# feed the batcher and the streamer
+# -------------------------
+def encode_prompt(tokenizer, text):
+    # DialoGPT expects each turn to be terminated by the EOS token
+    return tokenizer(text + tokenizer.eos_token)["input_ids"]
+
+def generate_tokens(model, tokenizer, batch_ids, **generate_kwargs):
+    # left-pad the id lists into one batch, generate, and decode only the new tokens
+    inputs = tokenizer.pad({"input_ids": list(batch_ids)}, return_tensors="pt").to(model.device)
+    with torch.inference_mode():
+        out = model.generate(**inputs, pad_token_id=tokenizer.pad_token_id, **generate_kwargs)
+    replies = tokenizer.batch_decode(out[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+    return [reply.strip() for reply in replies]
+
+# -------------------------
+# Micro-batcher: one background thread owns the model and batches prompts that
+# arrive within a short window (e.g. several open sessions hitting Send together)
+# -------------------------
+GENERATION_TIMEOUT = 120  # seconds; a stuck or dead worker surfaces as an error reply
+
+class Batcher:
+    def __init__(self, pipe, window=0.015, max_batch=8):
+        self.model = pipe.model
+        self.tokenizer = pipe.tokenizer
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, input_ids, **generate_kwargs):
+        fut = Future()
+        self.queue.put((input_ids, generate_kwargs, fut))
+        return fut
+
+    def stream(self, input_ids, **generate_kwargs):
+        # a job carrying its own streamer never shares a batch; tokens arrive as they are decoded
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=GENERATION_TIMEOUT)
+        return streamer, self.submit(input_ids, streamer=streamer, **generate_kwargs)
+
+    def _loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            try:
+                deadline = time.monotonic() + self.window
+                while len(jobs) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        jobs.append(self.queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                # only prompts with identical generation settings can share a generate() call
+                groups = {}
+                for job in jobs:
+                    groups.setdefault(tuple(sorted(job[1].items())), []).append(job)
+                for group in groups.values():
+                    self._run(group)
+            except Exception as e:
+                # never let the worker thread die: fail whatever is still pending and keep serving
+                self._fail(jobs, e)
+
+    def _run(self, jobs):
         try:
-            p2 = pipeline("text-generation", model=name)
-            return {"pipe": p2, "task": "text-generation"}
-        except Exception as e2:
-            st.error(f"Model load failed for both conversational and text-generation.\n"
-                     f"conversational error: {e}\ntext-generation error: {e2}")
-            return {"pipe": None, "task": None}
+            replies = generate_tokens(self.model, self.tokenizer, [ids for ids, _, _ in jobs], **jobs[0][1])
+        except Exception as e:
+            self._fail(jobs, e)
+            return
+        for (_, _, fut), reply in zip(jobs, replies):
+            if not fut.done():
+                fut.set_result(reply)
+
+    def _fail(self, jobs, exc):
+        for _, kwargs, fut in jobs:
+            if fut.done():
+                continue
+            if "streamer" in kwargs:
+                kwargs["streamer"].end()
+            fut.set_exception(exc)
+
+@st.cache_resource
+def get_batcher(name):
+    pipe = load_model(name)["pipe"]
+    return Batcher(pipe) if pipe is not None else None
 
 model_bundle = load_model(model_name)
 conv_pipe = model_bundle["pipe"]
-model_task = model_bundle["task"]
+batcher = get_batcher(model_name)
+
+# decoding is greedy, so identical (model, prompt ids, settings) always give the same
+# reply: reuse the cached one instead of another generation pass. A plain LRU rather
+# than st.cache_data, so the streamed path can check it first and store its reply after.
+class ReplyCache:
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, reply):
+        with self.lock:
+            self.entries[key] = reply
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+@st.cache_resource
+def get_reply_cache():
+    return ReplyCache()
+
+reply_cache = get_reply_cache()
 
 # translation helper (wraps deep-translator to mimic .translate(...).text)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+GOOGLE_TRANSLATE_URL = "https://translate.google.com/m"  # endpoint deep-translator scrapes
+
+async def _fetch_translation(client, sem, text, src, dest):
+    async with sem:
+        resp = await client.get(GOOGLE_TRANSLATE_URL, params={"sl": src, "tl": dest, "q": text})
+    resp.raise_for_status()
+    node = BeautifulSoup(resp.text, "html.parser").find("div", {"class": "result-container"})
+    return node.get_text() if node else None
+
+async def translate_many(sents, src, dest):
+    # concurrent requests (at most 6 in flight): wall time ~ slowest sentence, not the sum
+    sem = asyncio.Semaphore(6)
+    async with httpx.AsyncClient(timeout=10) as client:
+        return await asyncio.gather(*(_fetch_translation(client, sem, s, src, dest) for s in sents), return_exceptions=True)
+
+def _google_translate(text, src, dest):
+    sentences = [s for s in SENTENCE_SPLIT.split(text.strip()) if s]
+    if len(sentences) > 1:
+        parts = asyncio.run(translate_many(sentences, src, dest))
+        if all(isinstance(part, str) and part for part in parts):
+            return " ".join(parts)
+        # a sentence failed (burst 429, timeout, missing result): never join a partial
+        # translation; retry the whole text as one request below, which raises (and
+        # so caches nothing) if it fails too
+    # deep-translator requires explicit source/target codes; it will attempt autodetect if source='auto'
+    translated = GoogleTranslator(source=src, target=dest).translate(text)
+    if not translated:
+        raise ValueError("empty translation result")
+    return translated
+
+# Streamlit re-executes this file on every rerun, so the LRU lives in a cached
+# resource to survive across reruns and sessions
+@st.cache_resource
+def get_cached_translate():
+    return functools.lru_cache(maxsize=4096)(_google_translate)
+
 class SimpleTranslator:
     def translate(self, text, src="auto", dest="en"):
-        # deep-translator requires explicit source/target codes; it will attempt autodetect if source='auto'
-        # GoogleTranslator's constructor uses source and target as strings; for 'auto' we'll use source='auto'
+        # nothing to do: same language, or too short to be worth an HTTP call
+        if src == dest or len(text.strip()) <= 2:
+            return type("T", (), {"text": text})
         try:
-            translated = GoogleTranslator(source=src, target=dest).translate(text)
+            translated = get_cached_translate()(text, src, dest)
             # return object with .text attribute to match previous code pattern
-            return type("T", (), {"text": translated})
+            return type("T", (), {"text": translated or text})
         except Exception as e:
             # fallback: return original
             return type("T", (), {"text": text})
 
 translator = SimpleTranslator()
 
+def detect_language(text):
+    # local detection (a few ms; language profiles load on the first call) that spares
+    # an HTTP translation round-trip when the text is already English
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
 # -------------------------
-# Helper functions: audio convert, stt, tts
+# Helper functions: audio decode, stt, tts
 # -------------------------
-def convert_to_wav(src_path):
-    if src_path.lower().endswith(".wav"):
-        return src_path
-    wav_path = src_path + ".wav"
-    sound = AudioSegment.from_file(src_path)
-    sound.export(wav_path, format="wav")
-    return wav_path
+STT_SAMPLE_RATE = 16000
 
-def stt_from_file(uploaded_file):
+def load_audio_samples(uploaded_file):
+    # decode in-process to mono int16 at 16 kHz; no temp files
+    raw = uploaded_file.getvalue()
+    try:
+        # libsndfile handles wav/ogg/flac (and mp3 on recent builds)
+        data, sr_in = sf.read(io.BytesIO(raw), dtype="int16", always_2d=False)
+    except Exception:
+        # containers libsndfile can't read (e.g. m4a) still go through pydub/FFmpeg
+        ext = os.path.splitext(uploaded_file.name)[1].lstrip(".") or None
+        sound = AudioSegment.from_file(io.BytesIO(raw), format=ext).set_sample_width(2)
+        data = np.array(sound.get_array_of_samples(), dtype=np.int16).reshape(-1, sound.channels)
+        sr_in = sound.frame_rate
+    if data.ndim > 1:
+        data = data.mean(axis=1).astype(np.int16)
+    if sr_in != STT_SAMPLE_RATE:
+        data = resample_poly(data, STT_SAMPLE_RATE, sr_in)
+        data = np.clip(data, -32768, 32767).astype(np.int16)
+    return data
+
+@st.cache_resource
+def load_asr():
+    # local Whisper on CTranslate2 with INT8 weights; no network round-trip
+    compute_type = "int8_float16" if select_device()[0] == 0 else "int8"
+    return WhisperModel("base", device="auto", compute_type=compute_type)
+
+def stt_from_file(uploaded_file, lang="auto"):
     if not uploaded_file:
         return ""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-        tmp.write(uploaded_file.read())
-        tmp_path = tmp.name
     try:
-        wav_path = convert_to_wav(tmp_path)
-        r = sr.Recognizer()
-        with sr.AudioFile(wav_path) as source:
-            audio = r.record(source)
-        text = r.recognize_google(audio)
-    except sr.UnknownValueError:
-        text = ""
+        # faster-whisper takes float32 samples in [-1, 1] at 16 kHz
+        samples = load_audio_samples(uploaded_file).astype(np.float32) / 32768.0
+        if lang == "auto":
+            # 'auto' never runs text translation, so let Whisper detect the spoken
+            # language and emit English directly for the English-only chat model
+            segments, _ = load_asr().transcribe(samples, task="translate")
+        else:
+            segments, _ = load_asr().transcribe(samples, language=lang)
+        text = " ".join(seg.text.strip() for seg in segments).strip()
     except Exception as e:
         st.warning(f"Speech Recognition error: {e}")
         text = ""
-    finally:
-        try:
-            os.remove(tmp_path)
-            if wav_path != tmp_path and os.path.exists(wav_path):
-                os.remove(wav_path)
-        except Exception:
-            pass
     return text
 
+PIPER_MODEL_DIR = os.path.join("models", "piper")
+
+@st.cache_resource
+def load_piper(lang):
+    # expects a Piper voice exported as models/piper/<lang>.onnx (+ .onnx.json)
+    path = os.path.join(PIPER_MODEL_DIR, f"{lang}.onnx")
+    if PiperVoice is None or not os.path.exists(path):
+        return None
+    return PiperVoice.load(path)
+
 def generate_tts_audio(text, lang="en"):
+    # returns (audio_bytes, mime format) or (None, None)
+    lang = lang if lang != "auto" else "en"
     try:
-        tts = gTTS(text=text, lang=lang if lang != "auto" else "en")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-            tts.save(fp.name)
-            with open(fp.name, "rb") as f:
-                data = f.read()
-        os.remove(fp.name)
-        return data
+        voice = load_piper(lang)
+        if voice is not None:
+            # synthesize in-process straight into an in-memory WAV
+            buf = io.BytesIO()
+            with wave.open(buf, "wb") as wav_file:
+                synthesize = getattr(voice, "synthesize_wav", voice.synthesize)
+                synthesize(text, wav_file)
+            return buf.getvalue(), "audio/wav"
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buf)
+        return buf.getvalue(), "audio/mp3"
     except Exception as e:
         st.warning(f"TTS generation failed: {e}")
-        return None
+        return None, None
 
 # -------------------------
-# Conversation state
+# Conversation state: list of {"role": "user"|"assistant", "content": str}
+# Only the last HISTORY_WINDOW messages are rendered on each rerun; older ones
+# move to an archive that is drawn only on request.
 # -------------------------
+HISTORY_WINDOW = 40
+
 if "history" not in st.session_state:
     st.session_state.history = []
+if "archive" not in st.session_state:
+    st.session_state.archive = deque()
+
+def append_message(role, content):
+    history = st.session_state.history
+    history.append({"role": role, "content": content})
+    if len(history) > HISTORY_WINDOW:
+        st.session_state.archive.extend(history[:-HISTORY_WINDOW])
+        st.session_state.history = history[-HISTORY_WINDOW:]
 
 # -------------------------
 # UI
@@ -139,11 +467,17 @@ col1, col2 = st.columns([2, 1])
 
 with col1:
     st.header("Conversation")
-    for role, text in st.session_state.history:
-        if role == "user":
-            st.markdown(f"**👤 You:** {text}")
-        else:
-            st.markdown(f"**🤖 Bot:** {text}")
+    # a toggle rather than st.expander: expander bodies are rendered even when collapsed
+    archive = st.session_state.archive
+    if archive and st.toggle(f"Show full history ({len(archive)} earlier messages)"):
+        with st.container():
+            for msg in archive:
+                with st.chat_message(msg["role"]):
+                    st.write(msg["content"])
+    with st.container():
+        for msg in st.session_state.history:
+            with st.chat_message(msg["role"]):
+                st.write(msg["content"])
 
     st.divider()
     st.subheader("Send Message")
@@ -155,7 +489,7 @@ with col1:
     recognized_text = ""
     if uploaded_audio:
         with st.spinner("Processing voice input..."):
-            recognized_text = stt_from_file(uploaded_audio)
+            recognized_text = stt_from_file(uploaded_audio, interface_lang)
         if recognized_text:
             st.success(f"Recognized: {recognized_text}")
         else:
@@ -166,12 +500,20 @@ with col1:
         if not user_text:
             st.warning("No input provided.")
         else:
-            st.session_state.history.append(("user", user_text))
+            append_message("user", user_text)
+
+            # 'auto' never translates; otherwise skip the input translation when the
+            # text is already English, whatever the interface language
+            if interface_lang == "auto" or detect_language(user_text) == "en":
+                src_lang = "en"
+            else:
+                src_lang = interface_lang
+            reply_lang = interface_lang if interface_lang != "auto" else "en"
 
             # translate to en if needed
             try:
-                if interface_lang != "auto" and interface_lang != "en":
-                    user_input_en = translator.translate(user_text, src=interface_lang, dest="en").text
+                if src_lang != "en":
+                    user_input_en = translator.translate(user_text, src=src_lang, dest="en").text
                 else:
                     user_input_en = user_text
             except Exception:
@@ -182,48 +524,51 @@ with col1:
             if conv_pipe is None:
                 bot_reply = "Model not loaded. Check model choice and internet connection."
             else:
+                # greedy decoding with a hard cap on new tokens; the KV cache is kept explicitly
+                gen_kwargs = dict(max_new_tokens=max_new_tokens, do_sample=False, num_beams=1, use_cache=True)
+                input_ids = encode_prompt(conv_pipe.tokenizer, user_input_en)
+                cache_key = (model_name, tuple(input_ids), tuple(sorted(gen_kwargs.items())))
+                # render tokens as they are decoded; only when no reply translation is needed
+                stream_turn = stream_replies and reply_lang == "en"
                 try:
-                    if model_task == "conversational":
-                        # conv pipeline usually returns a Conversation object or list
-                        out = conv_pipe(user_input_en)
-                        conv_obj = out[0] if isinstance(out, (list, tuple)) else out
-                        if hasattr(conv_obj, "generated_responses") and conv_obj.generated_responses:
-                            bot_reply = conv_obj.generated_responses[-1]
-                        else:
-                            # fallback if structure differs
-                            bot_reply = getattr(conv_obj, "text", None) or getattr(conv_obj, "generated_text", None) or "Sorry, no reply."
+                    bot_reply = reply_cache.get(cache_key)
+                    if bot_reply is not None:
+                        if stream_turn:
+                            with st.chat_message("assistant"):
+                                st.write(bot_reply)
+                    elif stream_turn:
+                        streamer, fut = batcher.stream(input_ids, **gen_kwargs)
+                        with st.chat_message("assistant"):
+                            st.write_stream(streamer)
+                        bot_reply = fut.result(timeout=GENERATION_TIMEOUT)
                     else:
-                        # text-generation path
-                        gen = conv_pipe(user_input_en, max_length=150, do_sample=True, top_p=0.9, top_k=50)
-                        # gen is a list of dicts with 'generated_text'
-                        bot_reply = gen[0].get("generated_text", "Sorry, no reply.")
+                        bot_reply = batcher.submit(input_ids, **gen_kwargs).result(timeout=GENERATION_TIMEOUT)
+                    if bot_reply:
+                        reply_cache.put(cache_key, bot_reply)
+                    bot_reply = bot_reply or "Sorry, no reply."
+                except (FutureTimeoutError, queue.Empty):
+                    bot_reply = "The model did not respond in time. Please try again."
                 except Exception as e:
-                    st.warning(f"Primary model inference error: {e}")
-                    # Try a second fallback: text-generation pipeline explicitly
-                    try:
-                        text_pipe = pipeline("text-generation", model=model_name)
-                        gen = text_pipe(user_input_en, max_length=120, do_sample=True, top_p=0.9, top_k=50)
-                        bot_reply = gen[0].get("generated_text", "Sorry, no reply.")
-                    except Exception as e2:
-                        bot_reply = f"Error generating response: {e2}"
+                    # no second attempt: a retry would run the same call on the same weights
+                    bot_reply = f"Error generating response: {e}"
 
             # translate reply back if needed
             try:
-                if interface_lang != "auto" and interface_lang != "en":
-                    bot_reply_disp = translator.translate(bot_reply, src="en", dest=interface_lang).text
+                if reply_lang != "en":
+                    bot_reply_disp = translator.translate(bot_reply, src="en", dest=reply_lang).text
                 else:
                     bot_reply_disp = bot_reply
             except Exception:
                 bot_reply_disp = bot_reply
 
-            st.session_state.history.append(("bot", bot_reply_disp))
+            append_message("assistant", bot_reply_disp)
 
             # TTS playback
             if enable_tts:
                 with st.spinner("Generating voice reply..."):
-                    audio_bytes = generate_tts_audio(bot_reply_disp, lang=(interface_lang if interface_lang != "auto" else "en"))
+                    audio_bytes, audio_fmt = generate_tts_audio(bot_reply_disp, lang=reply_lang)
                     if audio_bytes:
-                        st.audio(audio_bytes, format="audio/mp3")
+                        st.audio(audio_bytes, format=audio_fmt)
 
 with col2:
     st.header("📘 Project Info")
@@ -231,11 +576,12 @@ with col2:
         """
 - **Goal:** Simplify parent–teacher communication in low-literacy regions.
 - **Features:** Multilingual voice input/output using NLP + Speech AI.
-- **Built with:** Streamlit, Transformers, SpeechRecognition, deep-translator, and gTTS.
+- **Built with:** Streamlit, Transformers, faster-whisper, deep-translator, Piper and gTTS.
 """
     )
     if st.button("🧹 Clear Chat"):
         st.session_state.history = []
-        st.experimental_rerun()
+        st.session_state.archive = deque()
+        st.rerun()
 
 st.caption("Prototype – For production, replace local model with an API-backed LLM (OpenAI or HF Inference) for reliable performance.")